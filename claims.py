@@ -1,5 +1,6 @@
 import os
 import google.generativeai as genai
+from llm_cache import cached_generate
 from typing import List, Dict
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
@@ -18,8 +19,7 @@ async def extract_claims(contents: List[str], search_results: List[Dict], query:
         url = search_results[i].get("link", "")
         prompt = f"Extract only the key claims, facts, and detailed information that directly answer the query '{query}' from the following text. Do not include any information that is not directly related to the query. Ensure each bullet point is directly relevant and provides information specifically requested by the query. If no relevant information is found, return an empty list. List them as comprehensive bullet points:\n\n{content}"
         try:
-            response = model.generate_content(prompt)
-            extracted_text = response.text.strip()
+            extracted_text = cached_generate(model, "extract_claims:v1", prompt, validate=lambda text: bool(text.strip()), query=query, content=content).strip()
             # Parse bullet points
             bullet_points = [line.strip('- ').strip() for line in extracted_text.split('\n') if line.strip()]
             # Limit to top 5 claims per source to focus on most relevant
@@ -2,6 +2,7 @@ import aiohttp
 import asyncio
 from bs4 import BeautifulSoup
 from typing import List, Dict
+from search import index_pages_in_background
 
 async def fetch_content(url: str) -> str:
     """
@@ -41,18 +42,27 @@ async def async_fetch_and_clean(search_results: List[Dict]) -> List[str]:
     Fetch and clean content from search results asynchronously.
     """
     tasks = []
+    fetched_results = []
     for result in search_results:
         url = result.get("link")
         if url:
             tasks.append(fetch_content(url))
+            fetched_results.append(result)
 
     if not tasks:
         return []
 
     htmls = await asyncio.gather(*tasks, return_exceptions=True)
     contents = []
-    for html in htmls:
+    pages = []
+    for result, html in zip(fetched_results, htmls):
         if isinstance(html, str) and html:
             clean_text = clean_html(html)
             contents.append(clean_text)
+            # Pages served from the offline index keep their original indexed time so they still age out
+            if not result.get("offline"):
+                pages.append({"link": result.get("link"), "title": result.get("title"), "content": clean_text})
+    # Remember fetched pages so the offline search provider can answer repeat topics
+    if pages:
+        index_pages_in_background(pages)
     return contents
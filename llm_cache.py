@@ -0,0 +1,159 @@
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Callable, Optional
+
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", os.path.join(".cache", "llm"))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))  # 200 MB
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))  # Seconds; 0 keeps entries until evicted
+
+# Cache entries in LRU order (oldest first): {key: size_in_bytes}
+cache_entries = None
+cache_size = 0
+# Prefetches run generation on a worker thread, so index updates are serialized
+cache_lock = threading.Lock()
+
+# Per-call-site counters: {template_id: {"hits": int, "misses": int, "rejected": int}}
+cache_counters: Dict[str, Dict[str, int]] = {}
+
+def normalize_input(value) -> str:
+    """
+    Normalize a prompt input so trivially different copies share a cache entry.
+    """
+    if isinstance(value, (list, tuple)):
+        return json.dumps([normalize_input(v) for v in value])
+    return re.sub(r"\s+", " ", str(value)).strip()
+
+def make_cache_key(model_name: str, template_id: str, inputs: Dict) -> str:
+    """
+    Hash (model, prompt template id, normalized inputs) into a content address.
+    """
+    payload = json.dumps({
+        "model": model_name,
+        "template": template_id,
+        "inputs": {k: normalize_input(v) for k, v in sorted(inputs.items())}
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def entry_path(key: str) -> str:
+    return os.path.join(LLM_CACHE_DIR, key[:2], f"{key}.json")
+
+def load_entries() -> OrderedDict:
+    """
+    Build the in-memory LRU index from the files on disk, oldest access first.
+    """
+    global cache_entries, cache_size
+    if cache_entries is not None:
+        return cache_entries
+    found = []
+    if os.path.isdir(LLM_CACHE_DIR):
+        for root, _, files in os.walk(LLM_CACHE_DIR):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(root, name))
+                except OSError:
+                    continue
+                found.append((stat.st_mtime, name[:-5], stat.st_size))
+    found.sort()
+    cache_entries = OrderedDict((key, size) for _, key, size in found)
+    cache_size = sum(cache_entries.values())
+    return cache_entries
+
+def remove_entry(key: str):
+    global cache_size
+    entries = load_entries()
+    cache_size -= entries.pop(key, 0)
+    try:
+        os.remove(entry_path(key))
+    except OSError:
+        pass
+
+def get_cached(key: str):
+    entries = load_entries()
+    if key not in entries:
+        return None
+    path = entry_path(key)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+        text = entry["text"]
+        expires_at = entry.get("expires_at")
+        if expires_at and time.time() > expires_at:
+            remove_entry(key)
+            return None
+        os.utime(path)  # Mark as recently used
+    except (OSError, ValueError, KeyError):
+        remove_entry(key)
+        return None
+    entries.move_to_end(key)
+    return text
+
+def put_cached(key: str, template_id: str, text: str, ttl: int):
+    global cache_size
+    entries = load_entries()
+    path = entry_path(key)
+    data = json.dumps({"template": template_id, "text": text, "expires_at": time.time() + ttl if ttl else None})
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(data)
+    except OSError as e:
+        print(f"Error writing LLM cache: {e}")
+        return
+    cache_size -= entries.pop(key, 0)
+    entries[key] = len(data.encode("utf-8"))
+    cache_size += entries[key]
+    # Evict least recently used entries until under the size bound
+    while cache_size > LLM_CACHE_MAX_BYTES and len(entries) > 1:
+        oldest = next(iter(entries))
+        remove_entry(oldest)
+
+def cached_generate(model, template_id: str, prompt: str, validate: Optional[Callable[[str], bool]] = None, ttl: Optional[int] = None, **inputs) -> str:
+    """
+    Return the text of model.generate_content(prompt), served from the on-disk cache
+    when the same model, template and normalized inputs were seen before.
+    A reply is only stored if validate(text) accepts it, so replies the caller cannot
+    parse are retried next time. Entries expire after ttl seconds (LLM_CACHE_TTL by default).
+    Errors from the model propagate to the caller and are never cached.
+    """
+    model_name = getattr(model, "model_name", str(model))
+    key = make_cache_key(model_name, template_id, inputs)
+    with cache_lock:
+        counters = cache_counters.setdefault(template_id, {"hits": 0, "misses": 0, "rejected": 0})
+        text = get_cached(key)
+        if text is not None:
+            counters["hits"] += 1
+            return text
+        counters["misses"] += 1
+    response = model.generate_content(prompt)
+    text = response.text
+    if validate is not None and not validate(text):
+        with cache_lock:
+            counters["rejected"] += 1
+        return text
+    with cache_lock:
+        put_cached(key, template_id, text, LLM_CACHE_TTL if ttl is None else ttl)
+    return text
+
+def get_cache_stats() -> Dict:
+    """
+    Report per-call-site hit rates and overall cache size.
+    """
+    sites = {}
+    with cache_lock:
+        for template_id, counters in sorted(cache_counters.items()):
+            total = counters["hits"] + counters["misses"]
+            sites[template_id] = {
+                "hits": counters["hits"],
+                "misses": counters["misses"],
+                "rejected": counters["rejected"],
+                "hit_rate": counters["hits"] / total if total else 0.0
+            }
+        entries = load_entries()
+        return {"entries": len(entries), "size_bytes": cache_size, "max_bytes": LLM_CACHE_MAX_BYTES, "call_sites": sites}
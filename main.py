@@ -1,7 +1,7 @@
 import os
 import base64
 import time
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Request, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Optional
@@ -19,6 +19,8 @@ from trust_scoring import update_trust_score, approve_source, mark_source_unreli
 from cve import cross_validate_claims
 from summarizer import summarize_results
 from graph_generator import generate_graph
+from llm_cache import get_cache_stats
+from prefetch import begin_request, end_request, schedule_prefetch, wait_for_prefetch
 
 app = FastAPI(title="AI Research Agent Backend")
 
@@ -32,6 +34,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def track_research_load(request: Request, call_next):
+    # Count in-flight research requests so background prefetches back off under load
+    if request.url.path != "/research":
+        return await call_next(request)
+    begin_request()
+    try:
+        return await call_next(request)
+    finally:
+        end_request()
+
 class ResearchQuery(BaseModel):
     query: str
 
@@ -39,7 +52,7 @@ class SourceURL(BaseModel):
     source: str
 
 @app.post("/research")
-async def research_endpoint(request: ResearchQuery):
+async def research_endpoint(request: ResearchQuery, background_tasks: BackgroundTasks):
     start_time = time.time()
     query = request.query.strip()
     if not query:
@@ -51,6 +64,12 @@ async def research_endpoint(request: ResearchQuery):
         print(f"DEBUG: Cache hit for query '{query}'")
         return response_cache[cache_key]
 
+    # A follow-up being prefetched right now will land in the cache shortly
+    await wait_for_prefetch(cache_key)
+    if cache_key in response_cache:
+        print(f"DEBUG: Prefetch hit for query '{query}'")
+        return response_cache[cache_key]
+
     # Step 0: Classify intent
     intent_start = time.time()
     from response_generator import classify_intent
@@ -70,14 +89,8 @@ async def research_endpoint(request: ResearchQuery):
     # Research path
     # Detect query types (points, table, graph) - can detect multiple
     # For simplicity, use keyword heuristics here; can be replaced with LLM classification
-    query_lower = query.lower()
-    query_types = []
-    if any(k in query_lower for k in ["table", "compare", "list", "dataframe"]):
-        query_types.append("table")
-    if any(k in query_lower for k in ["graph", "plot", "chart", "visualize"]):
-        query_types.append("graph")
-    if not query_types:
-        query_types = ["points"]
+    from response_generator import detect_query_types
+    query_types = detect_query_types(query)
 
     # Step 1: Search web asynchronously
     search_start = time.time()
@@ -107,6 +120,9 @@ async def research_endpoint(request: ResearchQuery):
     # Cache the response
     response_cache[cache_key] = response
 
+    # Warm the cache for likely follow-up clicks once the response has been sent
+    background_tasks.add_task(schedule_prefetch, response.get("follow_up_suggestions", []), contents, response_cache)
+
     return response
 
 @app.post("/approve_source")
@@ -125,5 +141,9 @@ async def flag_source_endpoint(request: SourceURL):
     mark_source_unreliable(source_url)
     return {"message": f"Source {source_url} flagged as unreliable and trust score updated."}
 
+@app.get("/cache_stats")
+async def cache_stats_endpoint():
+    return {"llm_cache": get_cache_stats()}
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
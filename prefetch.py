@@ -0,0 +1,170 @@
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict
+from response_generator import (
+    detect_query_types,
+    generate_points,
+    generate_table,
+    generate_related_insights,
+    generate_follow_up_suggestions,
+)
+
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "false").lower() in ("1", "true", "yes")
+PREFETCH_MAX_PER_QUERY = int(os.getenv("PREFETCH_MAX_PER_QUERY", "3"))
+PREFETCH_HOURLY_BUDGET = int(os.getenv("PREFETCH_HOURLY_BUDGET", "30"))  # Max prefetches started per hour
+PREFETCH_MAX_ACTIVE_REQUESTS = int(os.getenv("PREFETCH_MAX_ACTIVE_REQUESTS", "1"))  # Cancel above this many in-flight /research requests
+PREFETCH_START_DELAY = 1.0  # Seconds to wait before each prefetch so foreground work goes first
+
+# In-flight foreground /research requests
+active_requests = 0
+# Queued and running prefetches keyed by response cache key
+prefetch_tasks: Dict[str, asyncio.Task] = {}
+# Cache key of the prefetch currently generating, if any
+current_prefetch = None
+# Start times of recent prefetches, for the hourly budget
+prefetch_times = deque()
+# Created lazily so it binds to the running event loop
+prefetch_lock = None
+# Generations share one worker thread, so one that was cancelled but is still
+# finishing its current step is never joined by a second
+prefetch_executor = ThreadPoolExecutor(max_workers=1)
+
+def under_load() -> bool:
+    return active_requests > PREFETCH_MAX_ACTIVE_REQUESTS
+
+def begin_request():
+    global active_requests
+    active_requests += 1
+    if under_load():
+        cancel_prefetches()
+
+def end_request():
+    global active_requests
+    active_requests = max(active_requests - 1, 0)
+
+def cancel_prefetches():
+    """
+    Cancel queued and running prefetches.
+    A running generation stops after its current step (one points, table, insights
+    or follow-up call) and holds its slot until then.
+    """
+    global current_prefetch
+    if prefetch_tasks:
+        print(f"DEBUG: Cancelling {len(prefetch_tasks)} prefetch(es) under load")
+    # Cleared right away so clicks arriving before the tasks see their cancellation don't wait
+    current_prefetch = None
+    for task in list(prefetch_tasks.values()):
+        task.cancel()
+
+def budget_available() -> bool:
+    now = time.time()
+    while prefetch_times and now - prefetch_times[0] > 3600:
+        prefetch_times.popleft()
+    return len(prefetch_times) < PREFETCH_HOURLY_BUDGET
+
+async def generate_prefetch_response(query: str, contents: List[str], query_types: List[str], stop_event: threading.Event):
+    """
+    Build the same response as generate_response (graph queries are never prefetched),
+    one step at a time so a cancelled prefetch stops between Gemini calls.
+    Returns None if stopped before completion.
+    """
+    steps = []
+    if "points" in query_types or not query_types:
+        steps.append(("points", generate_points))
+    if "table" in query_types:
+        steps.append(("table", generate_table))
+    steps.append(("related_insights", generate_related_insights))
+    steps.append(("follow_up_suggestions", generate_follow_up_suggestions))
+    response = {}
+    for key, step in steps:
+        if stop_event.is_set():
+            return None
+        response[key] = await step(query, contents)
+    return response
+
+def run_generate_response(query: str, contents: List[str], query_types: List[str], stop_event: threading.Event):
+    # Runs on the prefetch thread with its own event loop, keeping the blocking Gemini calls off the server loop
+    return asyncio.run(generate_prefetch_response(query, contents, query_types, stop_event))
+
+async def prefetch_query(query: str, query_types: List[str], contents: List[str], response_cache):
+    global prefetch_lock, current_prefetch
+    cache_key = query.lower()
+    if prefetch_lock is None:
+        prefetch_lock = asyncio.Lock()
+    try:
+        # One prefetch at a time, and only while the server is idle enough
+        async with prefetch_lock:
+            await asyncio.sleep(PREFETCH_START_DELAY)
+            if under_load() or cache_key in response_cache:
+                return
+            start = time.time()
+            stop_event = threading.Event()
+            future = asyncio.get_running_loop().run_in_executor(prefetch_executor, run_generate_response, query, contents, query_types, stop_event)
+            current_prefetch = cache_key
+            try:
+                response = await asyncio.shield(future)
+            except asyncio.CancelledError:
+                stop_event.set()
+                # Stop new clicks on this follow-up from waiting on a cancelled prefetch
+                current_prefetch = None
+                # Keep the slot until the worker thread has actually finished
+                await asyncio.wait([future])
+                if not future.cancelled() and future.exception() is None and future.result():
+                    response_cache[cache_key] = future.result()  # Finished anyway, so keep it
+                raise
+            finally:
+                current_prefetch = None
+            if response:
+                response_cache[cache_key] = response
+            print(f"DEBUG: Prefetched follow-up '{query}' (took {time.time() - start:.2f}s)")
+    except asyncio.CancelledError:
+        print(f"DEBUG: Prefetch cancelled for '{query}'")
+        raise
+    except Exception as e:
+        print(f"Error prefetching follow-up '{query}': {e}")
+
+def forget_prefetch(cache_key: str, task: asyncio.Task):
+    # Done callback, so the entry is removed even if the task was cancelled before it started
+    if prefetch_tasks.get(cache_key) is task:
+        del prefetch_tasks[cache_key]
+
+async def schedule_prefetch(suggestions: List, contents: List[str], response_cache):
+    """
+    Queue the suggested follow-up queries for background generation into the response cache,
+    reusing the pages already fetched for the parent query instead of searching again.
+    """
+    if not PREFETCH_ENABLED or under_load():
+        return
+    for suggestion in suggestions[:PREFETCH_MAX_PER_QUERY]:
+        if not isinstance(suggestion, str) or not suggestion.strip():
+            continue
+        query = suggestion.strip()
+        cache_key = query.lower()
+        if cache_key in response_cache or cache_key in prefetch_tasks:
+            continue
+        query_types = detect_query_types(query)
+        # Graph rendering uses matplotlib's global state, which is not safe off the main thread
+        if "graph" in query_types:
+            continue
+        if not budget_available():
+            print("DEBUG: Prefetch budget exhausted, skipping remaining follow-ups")
+            return
+        prefetch_times.append(time.time())
+        task = asyncio.ensure_future(prefetch_query(query, query_types, contents, response_cache))
+        task.add_done_callback(lambda t, key=cache_key: forget_prefetch(key, t))
+        prefetch_tasks[cache_key] = task
+
+async def wait_for_prefetch(cache_key: str):
+    """
+    If the query is being generated by a prefetch right now, wait for it to land in the cache.
+    Queued prefetches are not waited on; the caller runs the normal pipeline instead.
+    """
+    task = prefetch_tasks.get(cache_key)
+    if task is None or current_prefetch != cache_key:
+        return
+    # asyncio.wait does not raise if the prefetch itself is cancelled
+    await asyncio.wait([task])
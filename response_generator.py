@@ -3,11 +3,47 @@ import json
 import asyncio
 from typing import List, Dict, Union
 import google.generativeai as genai
+from llm_cache import cached_generate
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 genai.configure(api_key=GEMINI_API_KEY)
 model = genai.GenerativeModel('gemini-2.5-flash')
 
+def parse_bullet_lines(text: str) -> List[str]:
+    return [line.lstrip('- ').strip() for line in text.split('\n') if line.strip() and len(line) > 5 and not line.lower().startswith(('here', 'the', 'based', 'content', 'points', 'bullet'))]
+
+def extract_json(text: str, opening: str, closing: str):
+    """
+    Parse the outermost JSON array or object out of a model reply.
+    """
+    start = text.find(opening)
+    end = text.rfind(closing) + 1
+    return json.loads(text[start:end])
+
+# Cache validators: only replies the call site can actually use are stored in the LLM cache
+def has_bullet_lines(text: str) -> bool:
+    return bool(parse_bullet_lines(text.strip()))
+
+def is_json_list(text: str) -> bool:
+    try:
+        parsed = extract_json(text.strip(), '[', ']')
+    except ValueError:
+        return False
+    return isinstance(parsed, list) and bool(parsed)
+
+def is_json_object(text: str) -> bool:
+    try:
+        parsed = extract_json(text.strip(), '{', '}')
+    except ValueError:
+        return False
+    return isinstance(parsed, dict) and bool(parsed)
+
+def is_intent(text: str) -> bool:
+    return text.strip().lower() in ['research', 'conversation']
+
+def is_non_empty(text: str) -> bool:
+    return bool(text.strip())
+
 async def summarize_content(contents: List[str]) -> str:
     if len(contents) == 0:
         return ""
@@ -17,8 +53,7 @@ async def summarize_content(contents: List[str]) -> str:
         combined = "\n\n".join(contents)
         prompt = f"Summarize the following web content into a concise version (max 5000 characters) while preserving key facts, data, and insights relevant for research queries. Keep it informative.\n\nContent:\n{combined[:15000]}"  # Limit input to avoid token limits
         try:
-            response = model.generate_content(prompt)
-            return response.text.strip()[:5000]  # Cap summary length
+            return cached_generate(model, "summarize_content:v1", prompt, validate=is_non_empty, content=combined[:15000]).strip()[:5000]  # Cap summary length
         except Exception as e:
             print(f"Error summarizing content: {e}")
             return combined[:5000]  # Fallback to truncated original
@@ -29,9 +64,8 @@ async def generate_points(query: str, contents: List[str]) -> Dict[int, Dict]:
     content_text = await summarize_content(contents)
     prompt = f"Based on the following summarized web content, generate 10-15 detailed bullet points that directly answer the query '{query}', including related insights, additional context, supporting details, and any relevant related fields or points for comprehensive business analyst research. Ensure the information is in-depth and useful. Format as bullet points, each starting with '-'.\n\nContent:\n{content_text}"
     try:
-        response = model.generate_content(prompt)
-        text = response.text.strip()
-        lines = [line.lstrip('- ').strip() for line in text.split('\n') if line.strip() and len(line) > 5 and not line.lower().startswith(('here', 'the', 'based', 'content', 'points', 'bullet'))]
+        text = cached_generate(model, "generate_points:v1", prompt, validate=has_bullet_lines, query=query, content=content_text).strip()
+        lines = parse_bullet_lines(text)
         points = {}
         if lines:
             for i, line in enumerate(lines[:15]):  # Limit to 15
@@ -56,13 +90,8 @@ async def generate_table(query: str, contents: List[str]) -> List[Dict]:
     content_text = await summarize_content(contents)
     prompt = f"Based on the following summarized web content, generate a JSON array of objects representing a table that answers the query '{query}'. Each object should have keys like 'Item', 'Description', 'Details'. Include up to 10 rows. Output only valid JSON.\n\nContent:\n{content_text}"
     try:
-        response = model.generate_content(prompt)
-        text = response.text.strip()
-        # Extract JSON
-        start = text.find('[')
-        end = text.rfind(']') + 1
-        json_str = text[start:end]
-        table = json.loads(json_str)
+        text = cached_generate(model, "generate_table:v1", prompt, validate=is_json_list, query=query, content=content_text).strip()
+        table = extract_json(text, '[', ']')
         return table if isinstance(table, list) else []
     except Exception as e:
         print(f"Error generating table: {e}")
@@ -72,13 +101,8 @@ async def generate_graph_data(query: str, contents: List[str]) -> Dict:
     content_text = "\n\n".join(contents)
     prompt = f"Based on the following web content, generate comprehensive JSON data for a detailed chart that visualizes the answer to the query '{query}'. Include 'type' (bar, line, pie), 'labels' (a list of at least 10 strings for detailed categories), 'values' (a corresponding list of numbers), 'title', and optionally 'additional_data' for more insights. Ensure the data is rich and suitable for business analyst research. Output only valid JSON. If you cannot generate valid JSON, output an empty JSON object {{}}.\n\nContent:\n{content_text}"
     try:
-        response = model.generate_content(prompt)
-        text = response.text.strip()
-        # Extract JSON
-        start = text.find('{')
-        end = text.rfind('}') + 1
-        json_str = text[start:end]
-        data = json.loads(json_str)
+        text = cached_generate(model, "generate_graph_data:v1", prompt, validate=is_json_object, query=query, content=content_text).strip()
+        data = extract_json(text, '{', '}')
         return data if isinstance(data, dict) else {}
     except Exception as e:
         print(f"Error generating graph data: {e}")
@@ -88,9 +112,8 @@ async def generate_related_insights(query: str, contents: List[str]) -> Dict[int
     content_text = "\n\n".join(contents)
     prompt = f"Based on the following web content, generate 10-15 bullet points on related insights, additional context, related topics, or interesting fields that complement the query '{query}' for deeper business analyst research. Include broader implications, trends, or connected areas. Format as bullet points, each starting with '-'.\n\nContent:\n{content_text}"
     try:
-        response = model.generate_content(prompt)
-        text = response.text.strip()
-        lines = [line.lstrip('- ').strip() for line in text.split('\n') if line.strip() and len(line) > 5 and not line.lower().startswith(('here', 'the', 'based', 'content', 'points', 'bullet'))]
+        text = cached_generate(model, "generate_related_insights:v1", prompt, validate=has_bullet_lines, query=query, content=content_text).strip()
+        lines = parse_bullet_lines(text)
         insights = {}
         if lines:
             for i, line in enumerate(lines[:15]):  # Limit to 15
@@ -114,23 +137,32 @@ async def generate_follow_up_suggestions(query: str, contents: List[str]) -> Lis
     content_text = "\n\n".join(contents)
     prompt = f"Based on the query '{query}' and the following content, generate 2-3 follow-up questions or suggestions that a business analyst might find useful for deeper research. These should be related topics, additional details, or expansions on the original query. Format as a JSON array of strings.\n\nContent:\n{content_text}"
     try:
-        response = model.generate_content(prompt)
-        text = response.text.strip()
-        # Extract JSON
-        start = text.find('[')
-        end = text.rfind(']') + 1
-        json_str = text[start:end]
-        suggestions = json.loads(json_str)
+        text = cached_generate(model, "generate_follow_up_suggestions:v1", prompt, validate=is_json_list, query=query, content=content_text).strip()
+        suggestions = extract_json(text, '[', ']')
         return suggestions if isinstance(suggestions, list) else []
     except Exception as e:
         print(f"Error generating follow-up suggestions: {e}")
         return []
 
+def detect_query_types(query: str) -> List[str]:
+    """
+    Detect output types (points, table, graph) from keywords; a query can have several.
+    """
+    query_lower = query.lower()
+    query_types = []
+    if any(k in query_lower for k in ["table", "compare", "list", "dataframe"]):
+        query_types.append("table")
+    if any(k in query_lower for k in ["graph", "plot", "chart", "visualize"]):
+        query_types.append("graph")
+    if not query_types:
+        query_types = ["points"]
+    return query_types
+
 async def classify_intent(query: str) -> str:
     prompt = f"Classify the following user query as either 'research' or 'conversation'. 'Research' means the query requires searching the web, analyzing data, or providing in-depth information on a topic. 'Conversation' means casual chat, greetings, small talk, or simple questions that don't require external research. Respond with only one word: 'research' or 'conversation'.\n\nQuery: {query}"
     try:
-        response = model.generate_content(prompt)
-        intent = response.text.strip().lower()
+        # Intent does not depend on letter case, so repeated phrasings share an entry
+        intent = cached_generate(model, "classify_intent:v1", prompt, validate=is_intent, query=query.lower()).strip().lower()
         if intent in ['research', 'conversation']:
             return intent
         else:
@@ -142,6 +174,7 @@ async def classify_intent(query: str) -> str:
 async def generate_conversation(query: str) -> Dict:
     prompt = f"Respond to the following user query in a friendly, conversational manner. Keep the response engaging, helpful, and casual. Do not provide research or in-depth analysis. If it's a greeting, respond warmly. If it's a question, answer briefly and naturally.\n\nQuery: {query}"
     try:
+        # Not cached: small talk such as greetings or "what's the date" depends on when it is asked
         response = model.generate_content(prompt)
         text = response.text.strip()
         return {
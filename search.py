@@ -1,10 +1,50 @@
 import os
+import re
+import json
+import math
+import time
+import asyncio
+import hashlib
+import sqlite3
 import aiohttp
-from typing import List, Dict
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Callable, Awaitable
+from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
 
 SERPER_API_KEY = os.getenv("SERPER_API_KEY")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
+SEARCH_CACHE_DIR = os.getenv("SEARCH_CACHE_DIR", os.path.join(".cache", "search"))
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", "3600"))  # Seconds
+SEARCH_INDEX_PATH = os.getenv("SEARCH_INDEX_PATH", os.path.join(".cache", "search_index.sqlite3"))
+SEARCH_INDEX_MAX_DOCS = int(os.getenv("SEARCH_INDEX_MAX_DOCS", "1000"))
+SEARCH_INDEX_MAX_AGE = int(os.getenv("SEARCH_INDEX_MAX_AGE", "86400"))  # Seconds a page may answer queries offline
+OFFLINE_MIN_RESULTS = int(os.getenv("OFFLINE_MIN_RESULTS", "3"))  # Offline hits needed to skip external search
+OFFLINE_MIN_COVERAGE = 0.75  # Fraction of query terms a page must contain
+OFFLINE_MIN_TERMS = 2  # Queries with fewer meaningful terms always go to external search
+OFFLINE_MIN_SCORE = 1.0  # Minimum TF-IDF score per query term for an offline hit
+HEDGE_PERCENTILE = float(os.getenv("SEARCH_HEDGE_PERCENTILE", "0.9"))
+HEDGE_DEFAULT_DELAY = 1.5  # Seconds, used until enough latency samples exist
+HEDGE_MIN_SAMPLES = 10
+MAX_RESULTS = 10
+
+SearchProvider = Callable[[str], Awaitable[List[Dict]]]
+
+# Recent latencies per provider, used to pick the hedge delay
+provider_latencies: Dict[str, deque] = {}
+
+# Short tokens such as 'ai', 'eu', 'us' or '5g' are kept, so filler words are listed here instead
+STOPWORDS = {
+    "a", "an", "am", "as", "at", "be", "by", "do", "if", "in", "is", "it", "me", "my",
+    "no", "of", "on", "or", "so", "to", "up", "we", "vs", "versus",
+    "the", "and", "for", "with", "that", "this", "from", "are", "was", "were", "what",
+    "which", "who", "how", "why", "when", "where", "about", "into", "than", "then",
+    "its", "has", "have", "had", "not", "but", "you", "your", "our", "can", "will",
+    "does", "did", "should", "could", "would", "there", "their", "they", "these", "those",
+    "explain", "tell", "give", "show", "compare", "list", "table", "graph", "chart", "plot",
+}
+
 async def serper_search(query: str) -> List[Dict]:
     """
     Perform a web search using Serper API.
@@ -40,11 +80,277 @@ async def google_gemini_search(query: str) -> List[Dict]:
     # For now, return empty list
     return []
 
+# External providers in priority order; the first one is the primary.
+# google_gemini_search stays out until it is implemented, otherwise it would win every hedge with no results.
+SEARCH_PROVIDERS: List[SearchProvider] = [serper_search]
+
+def register_search_provider(provider: SearchProvider, primary: bool = False):
+    """
+    Add an external search provider. Providers take a query and return
+    a list of dicts with 'title' and 'link'.
+    """
+    if provider in SEARCH_PROVIDERS:
+        SEARCH_PROVIDERS.remove(provider)
+    if primary:
+        SEARCH_PROVIDERS.insert(0, provider)
+    else:
+        SEARCH_PROVIDERS.append(provider)
+
+def canonicalize_url(url: str) -> str:
+    """
+    Normalize a URL so the same page from different providers dedupes.
+    Lowercases scheme and host, drops 'www.', fragments, tracking params and trailing slashes.
+    """
+    parsed = urlparse(url.strip())
+    netloc = parsed.netloc.lower()
+    if netloc.startswith("www."):
+        netloc = netloc[4:]
+    query = [(k, v) for k, v in parse_qsl(parsed.query) if not k.lower().startswith("utm_") and k.lower() not in ("gclid", "fbclid")]
+    path = parsed.path.rstrip("/") or "/"
+    return urlunparse(((parsed.scheme or "http").lower(), netloc, path, "", urlencode(sorted(query)), ""))
+
+def merge_results(result_lists: List[List[Dict]]) -> List[Dict]:
+    """
+    Merge result lists in order, keeping the first result for each canonical URL.
+    """
+    merged = []
+    seen = set()
+    for results in result_lists:
+        for item in results:
+            link = item.get("link")
+            if not link:
+                continue
+            key = canonicalize_url(link)
+            if key in seen:
+                continue
+            seen.add(key)
+            merged.append(item)
+    return merged[:MAX_RESULTS]
+
+def record_latency(provider: SearchProvider, elapsed: float):
+    samples = provider_latencies.setdefault(provider.__name__, deque(maxlen=100))
+    samples.append(elapsed)
+
+def hedge_delay(provider: SearchProvider) -> float:
+    """
+    Delay before sending a hedged request, taken from the provider's latency percentile.
+    """
+    samples = provider_latencies.get(provider.__name__)
+    if not samples or len(samples) < HEDGE_MIN_SAMPLES:
+        return HEDGE_DEFAULT_DELAY
+    ordered = sorted(samples)
+    index = min(int(len(ordered) * HEDGE_PERCENTILE), len(ordered) - 1)
+    return ordered[index]
+
+async def timed_search(provider: SearchProvider, query: str) -> List[Dict]:
+    start = time.time()
+    try:
+        return await provider(query)
+    except Exception as e:
+        print(f"Error in search provider {provider.__name__}: {e}")
+        return []
+    finally:
+        # Also recorded when a losing request is cancelled, so slow samples still count toward the percentile
+        record_latency(provider, time.time() - start)
+
+async def hedged_search(query: str) -> List[Dict]:
+    """
+    Query the primary provider and, if it has not answered within its latency
+    percentile (or answered empty), send a hedged request to the next provider.
+    When the primary is the only provider it is re-issued as its own hedge,
+    but only on a timeout; an empty answer from it is final.
+    Results from every provider that has finished are merged and deduped.
+    """
+    if not SEARCH_PROVIDERS:
+        return []
+    primary = SEARCH_PROVIDERS[0]
+    backups = list(SEARCH_PROVIDERS[1:])
+    self_hedge = not backups
+    pending = {asyncio.ensure_future(timed_search(primary, query))}
+    finished = []
+    delay = hedge_delay(primary)
+    try:
+        while pending:
+            can_hedge = bool(backups) or self_hedge
+            done, pending = await asyncio.wait(pending, timeout=delay if can_hedge else None, return_when=asyncio.FIRST_COMPLETED)
+            finished.extend(task.result() for task in done)
+            if any(finished):
+                break
+            if backups:
+                hedge = backups.pop(0)
+            elif self_hedge and pending:
+                hedge = primary
+                self_hedge = False
+            else:
+                continue
+            print(f"DEBUG: Sending hedged search request to {hedge.__name__}")
+            pending.add(asyncio.ensure_future(timed_search(hedge, query)))
+    finally:
+        for task in pending:
+            task.cancel()
+    return merge_results(finished)
+
+def cache_path(query: str) -> str:
+    key = hashlib.sha256(query.strip().lower().encode("utf-8")).hexdigest()
+    return os.path.join(SEARCH_CACHE_DIR, f"{key}.json")
+
+def load_cached_results(query: str):
+    """
+    Return cached results for a query, or None if missing or older than the TTL.
+    """
+    path = cache_path(query)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if time.time() - entry.get("timestamp", 0) > SEARCH_CACHE_TTL:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return None
+    return entry.get("results")
+
+def save_cached_results(query: str, results: List[Dict]):
+    try:
+        os.makedirs(SEARCH_CACHE_DIR, exist_ok=True)
+        with open(cache_path(query), "w", encoding="utf-8") as f:
+            json.dump({"timestamp": time.time(), "query": query, "results": results}, f)
+    except OSError as e:
+        print(f"Error writing search cache: {e}")
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in re.findall(r"[a-z0-9]+", text.lower()) if (len(t) > 1 or t.isdigit()) and t not in STOPWORDS]
+
+# Inverted index over previously fetched pages, kept in sqlite so pages are added incrementally
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (url TEXT PRIMARY KEY, title TEXT, indexed_at REAL);
+CREATE INDEX IF NOT EXISTS docs_indexed_at ON docs (indexed_at);
+CREATE TABLE IF NOT EXISTS postings (term TEXT, url TEXT, tf INTEGER, PRIMARY KEY (term, url)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_url ON postings (url);
+"""
+
+# Index writes run on a single worker thread: one sqlite writer, and the event loop never blocks on them
+index_executor = ThreadPoolExecutor(max_workers=1)
+
+def connect_index() -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(SEARCH_INDEX_PATH) or ".", exist_ok=True)
+    conn = sqlite3.connect(SEARCH_INDEX_PATH, timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")  # Readers are not blocked by the writer
+    conn.executescript(INDEX_SCHEMA)
+    return conn
+
+def remove_from_index(conn: sqlite3.Connection, urls: List[str]):
+    conn.executemany("DELETE FROM postings WHERE url = ?", [(url,) for url in urls])
+    conn.executemany("DELETE FROM docs WHERE url = ?", [(url,) for url in urls])
+
+def index_pages(pages: List[Dict]):
+    """
+    Add fetched pages to the offline index.
+    Each page is a dict with 'link', 'title' and the cleaned 'content'.
+    Blocking; call through index_pages_in_background from async code.
+    """
+    try:
+        conn = connect_index()
+        try:
+            with conn:
+                for page in pages:
+                    url = page.get("link")
+                    content = page.get("content", "")
+                    if not url or not content:
+                        continue
+                    counts = {}
+                    for term in tokenize(f"{page.get('title') or ''} {content}"):
+                        counts[term] = counts.get(term, 0) + 1
+                    remove_from_index(conn, [url])
+                    conn.executemany("INSERT INTO postings (term, url, tf) VALUES (?, ?, ?)", [(term, url, tf) for term, tf in counts.items()])
+                    conn.execute("INSERT INTO docs (url, title, indexed_at) VALUES (?, ?, ?)", (url, page.get("title") or url, time.time()))
+                # Drop pages too old to answer offline, then the oldest ones once over capacity
+                expired = [row[0] for row in conn.execute("SELECT url FROM docs WHERE indexed_at < ?", (time.time() - SEARCH_INDEX_MAX_AGE,))]
+                remove_from_index(conn, expired)
+                overflow = conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0] - SEARCH_INDEX_MAX_DOCS
+                if overflow > 0:
+                    oldest = [row[0] for row in conn.execute("SELECT url FROM docs ORDER BY indexed_at LIMIT ?", (overflow,))]
+                    remove_from_index(conn, oldest)
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"Error updating search index: {e}")
+
+def index_pages_in_background(pages: List[Dict]):
+    """
+    Queue pages for indexing on the index worker thread without waiting for it.
+    """
+    asyncio.get_running_loop().run_in_executor(index_executor, index_pages, pages)
+
+def query_index(terms: List[str]) -> List[Dict]:
+    """
+    Rank indexed pages younger than SEARCH_INDEX_MAX_AGE for the query terms (TF-IDF).
+    Blocking; runs on an executor thread.
+    """
+    try:
+        conn = connect_index()
+        try:
+            cutoff = time.time() - SEARCH_INDEX_MAX_AGE
+            num_docs = conn.execute("SELECT COUNT(*) FROM docs WHERE indexed_at >= ?", (cutoff,)).fetchone()[0]
+            if not num_docs:
+                return []
+            scores = {}
+            matched = {}
+            for term in terms:
+                postings = conn.execute(
+                    "SELECT p.url, p.tf FROM postings p JOIN docs d ON d.url = p.url WHERE p.term = ? AND d.indexed_at >= ?",
+                    (term, cutoff)
+                ).fetchall()
+                if not postings:
+                    continue
+                idf = math.log(1 + num_docs / len(postings))
+                for url, tf in postings:
+                    scores[url] = scores.get(url, 0.0) + (1 + math.log(tf)) * idf
+                    matched[url] = matched.get(url, 0) + 1
+            candidates = [url for url in scores if matched[url] / len(terms) >= OFFLINE_MIN_COVERAGE and scores[url] / len(terms) >= OFFLINE_MIN_SCORE]
+            candidates.sort(key=lambda u: scores[u], reverse=True)
+            results = []
+            for url in candidates[:MAX_RESULTS]:
+                row = conn.execute("SELECT title FROM docs WHERE url = ?", (url,)).fetchone()
+                if row:
+                    # Marked so the fetcher does not re-index it and reset its age
+                    results.append({"title": row[0], "link": url, "offline": True})
+            return results
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"Error reading search index: {e}")
+        return []
+
+async def offline_search(query: str) -> List[Dict]:
+    """
+    Search previously fetched pages using the local inverted index (TF-IDF ranking).
+    Only pages containing most of the query terms with a high enough score are returned,
+    and queries with too few meaningful terms are left to external search.
+    """
+    terms = sorted(set(tokenize(query)))
+    if len(terms) < OFFLINE_MIN_TERMS:
+        return []
+    return await asyncio.get_running_loop().run_in_executor(None, query_index, terms)
+
 async def async_search(query: str) -> List[Dict]:
     """
-    Perform web search using Serper API first, fallback to Google Gemini API.
+    Perform web search: on-disk result cache first, then the offline index,
+    then external providers with hedging. Too few offline hits are merged
+    after the external results rather than dropped.
     """
-    results = await serper_search(query)
-    if not results:
-        results = await google_gemini_search(query)
-    return results
+    cached = load_cached_results(query)
+    if cached:
+        print(f"DEBUG: Search cache hit for query '{query}'")
+        return cached
+    offline_results = await offline_search(query)
+    if len(offline_results) >= OFFLINE_MIN_RESULTS:
+        print(f"DEBUG: Answered query '{query}' from offline index ({len(offline_results)} results)")
+        return offline_results
+    results = await hedged_search(query)
+    if results:
+        # Only external results are cached; offline hits follow their own max age
+        save_cached_results(query, results)
+    return merge_results([results, offline_results])